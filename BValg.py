@@ -1,9 +1,32 @@
-import qiskit
+from __future__ import annotations
+import functools
 from typing import List, Union, Any
 import numpy as np
-from qiskit_aer import AerSimulator
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# qiskit and qiskit_aer are slow to import, so they are loaded by _lazy()
+# the first time a circuit is built. The bit helpers do not need them.
+# The names are private so "from BValg import *" never exports the placeholders.
+_qiskit = None
+_AerSimulator = None
+_GateDepolarizingNoiseModel = None
+
+
+def _lazy() -> None:
+    global _qiskit, _AerSimulator, _GateDepolarizingNoiseModel
+    if _qiskit is not None:
+        return
+    import qiskit as _qiskit
+    from qiskit_aer import AerSimulator as _AerSimulator
+    from noise import GateDepolarizingNoiseModel as _GateDepolarizingNoiseModel
+
 
 def convert_int_to_list(num_qubits: int, alginput: int):
+    # Deprecated: compile_func now tests the bits of _a directly
+    warnings.warn("convert_int_to_list is deprecated, test bits with (a >> i) & 1 instead",
+                  DeprecationWarning, stacklevel=2)
     controllist = []
     k = alginput
     for i in range(0, num_qubits):
@@ -13,10 +36,66 @@ def convert_int_to_list(num_qubits: int, alginput: int):
 
 
 def convert_list_to_int(num_qubits: int, bitlist: List):
-    result = 0
-    for i in range(num_qubits):
-        result = result + (bitlist[i] << (num_qubits - 1 - i))
-    return result
+    # Small inputs fold in Python, large inputs are packed by numpy in C
+    if num_qubits < 64:
+        return functools.reduce(lambda acc, bit: (acc << 1) | bit, bitlist[:num_qubits], 0)
+    arr = np.asarray(bitlist[:num_qubits], dtype=np.uint8)
+    # Left padding with zeros keeps the value unchanged
+    padded = np.pad(arr, ((-len(arr)) % 8, 0))
+    return int.from_bytes(np.packbits(padded, bitorder='big').tobytes(), 'big')
+
+
+# Kernels for whole batches of inputs. They work on uint64 so shifts never
+# overflow a signed int64. Scalar calls stay on the helpers above, where the
+# array conversion and dispatch would cost more than the loop itself.
+def _ints_to_bits(values, nq):
+    out = np.empty((values.shape[0], nq), np.uint8)
+    for r in range(values.shape[0]):
+        for i in range(nq):
+            out[r, nq - 1 - i] = (values[r] >> np.uint64(i)) & np.uint64(1)
+    return out
+
+
+def _bits_to_ints(bits):
+    out = np.zeros(bits.shape[0], np.uint64)
+    for r in range(bits.shape[0]):
+        result = np.uint64(0)
+        for i in range(bits.shape[1]):
+            result = (result << np.uint64(1)) | np.uint64(bits[r, i])
+        out[r] = result
+    return out
+
+
+# Numba is optional and only imported the first time a batch helper needs it
+@functools.lru_cache(maxsize=None)
+def _numba_kernels():
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+    return njit(cache=True)(_ints_to_bits), njit(cache=True)(_bits_to_ints)
+
+
+def convert_ints_to_lists(num_qubits: int, values) -> np.ndarray:
+    if num_qubits > 64:
+        raise ValueError("Batch conversion supports at most 64 bits")
+    values = np.asarray(values, dtype=np.uint64)
+    kernels = _numba_kernels()
+    if kernels is not None:
+        return kernels[0](values, num_qubits)
+    shifts = np.arange(num_qubits - 1, -1, -1, dtype=np.uint64)
+    return ((values[:, None] >> shifts) & np.uint64(1)).astype(np.uint8)
+
+
+def convert_lists_to_ints(num_qubits: int, bitlists) -> np.ndarray:
+    if num_qubits > 64:
+        raise ValueError("Batch conversion supports at most 64 bits")
+    bits = np.ascontiguousarray(np.asarray(bitlists, dtype=np.uint8)[:, :num_qubits])
+    kernels = _numba_kernels()
+    if kernels is not None:
+        return kernels[1](bits)
+    weights = np.uint64(1) << np.arange(num_qubits - 1, -1, -1, dtype=np.uint64)
+    return np.bitwise_or.reduce(bits.astype(np.uint64) * weights, axis=1)
 
 class QuantumAlgorithm:
 
@@ -46,11 +125,19 @@ class BVAlgorithm_qiskit(QuantumAlgorithm):
     def __init__(self, num_qubits: int) -> None:
         super().__init__(num_qubits)
         self.num_qubits = num_qubits
-        self.circuit = qiskit.QuantumCircuit(num_qubits, num_qubits - 1)
-        self.simulator = AerSimulator()
+        _lazy()
+        self.circuit = _qiskit.QuantumCircuit(num_qubits, num_qubits - 1)
+        # The automatic method already picks stabilizer for this Clifford circuit
+        # under Clifford noise, and still accepts non-Clifford noise models
+        self.simulator = _AerSimulator()
+        self._compiled_circuit = None
+        self._probability_circuit = None
+        self._data_q_idx = list(range(0, num_qubits - 1))
         self.computed = False
         self._a = 0
         self._b = 0
+        self._popcount = 0
+        self._target_str = self.a_to_string()
         self.computed_a_value = -1
 
     '''
@@ -63,10 +150,18 @@ class BVAlgorithm_qiskit(QuantumAlgorithm):
         The first layer of Hadmard 
         '''
         self.circuit.x(inputdim)
-        self.circuit.h(list(range(0, self.num_qubits-1)))
+        self.circuit.h(self._data_q_idx)
         self.compile_func()
-        self.circuit.h(list(range(0, self.num_qubits-1)))
-        self.circuit.measure(list(range(0, self.num_qubits - 1)), list(range(0, self.num_qubits - 1)))
+        self.circuit.h(self._data_q_idx)
+        self.circuit.measure(self._data_q_idx, self._data_q_idx)
+        self._compiled_circuit = None
+        self._probability_circuit = None
+
+    def clear_circuit(self) -> None:
+        self.circuit = _qiskit.QuantumCircuit(self.num_qubits, self.num_qubits - 1)
+        self._compiled_circuit = None
+        self._probability_circuit = None
+        self.computed = False
 
     '''
     The input of Berstain vazirani is a linear function f(x)=ax+b.
@@ -84,34 +179,73 @@ class BVAlgorithm_qiskit(QuantumAlgorithm):
             raise ValueError("b has to be 0 or 1")
         if not (0 <= self._a < (1 << (self.num_qubits - 1))):
             raise ValueError("a out of range")
+        # a stays a plain int, its set bits are counted once per input
+        self._popcount = self._a.bit_count()
+        self._target_str = self.a_to_string()
+        self._compiled_circuit = None
+        self._probability_circuit = None
+
+    '''
+    The oracle sub-circuit only depends on (num_qubits, a, b), so it is built
+    once and composed into every circuit that needs it.
+    '''
+
+    @classmethod
+    @functools.lru_cache(maxsize=128)
+    def _oracle(cls, num_qubits: int, a: int, b: int) -> _qiskit.QuantumCircuit:
+        _lazy()
+        oracle = _qiskit.QuantumCircuit(num_qubits)
+        last = num_qubits - 1
+        # Pop the lowest set bit each step.
+        # Qubit i carries bit (num_qubits-2-i) of a, most significant bit first
+        controls = []
+        while a:
+            bit = (a & -a).bit_length() - 1
+            controls.append(num_qubits - 2 - bit)
+            a &= a - 1
+        # Emit all CZs in one broadcast call
+        if controls:
+            oracle.cz(controls, [last] * len(controls))
+        if b == 1:
+            oracle.x(last)
+        return oracle
 
     def compile_func(self) -> None:
-        alist = convert_int_to_list(self.num_qubits - 1, self._a)
-        for i in range(0, self.num_qubits - 1):
-            if alist[i] == 1:
-                self.circuit.cz(i, self.num_qubits - 1)
-        if self._b == 1:
-            self.circuit.x(self.num_qubits - 1)
+        self.circuit.compose(self._oracle(self.num_qubits, self._a, self._b), inplace=True)
         return
 
     def a_to_string(self) -> str:
         return bin(self._a)[2:].zfill(self.num_qubits - 1)[::-1]
 
 
+    '''
+    Return the fraction of shots that measure a.
+    Without a noise model on a noiseless AerSimulator BV is deterministic and
+    always measures a, so the simulator is skipped and the accuracy is 1.0.
+    a_result() then returns the most likely measured a on every path.
+    '''
+
     def compute_result(self,shots) -> None:
-        compiled_circuit = qiskit.transpile(self.circuit, self.simulator)
-        # Execute the circuit on the aer simulator
-        job = self.simulator.run(compiled_circuit, shots=shots,noise_model=self._noise_model)
+        noise_model = self.effective_noise_model()
+        if noise_model is None and isinstance(self.simulator, _AerSimulator):
+            self.computed = True
+            self.computed_a_value = self._a
+            return 1.0
+        if isinstance(noise_model, _GateDepolarizingNoiseModel):
+            return self.compute_result_analytic(noise_model.p_single, noise_model.p_twoq)
+        if (noise_model is not None and isinstance(self.simulator, _AerSimulator)
+                and 'measure' not in noise_model.noise_instructions):
+            return self.compute_result_probability(shots)
+
+        job = self.simulator.run(self.compile_circuit(), shots=shots,noise_model=noise_model)
         # Grab results from the job
         result = job.result()
         # print(result)
         # Returns counts
-        counts = dict(result.get_counts(compiled_circuit))
+        counts = result.get_counts(self._compiled_circuit)
         
-        if self.a_to_string() in counts:
-            result = counts[self.a_to_string()]
-        else:
-            result = 0
+        result = counts.get(self._target_str, 0)
+        self.computed_a_value = int(max(counts, key=counts.get)[::-1], 2)
             
         accuracy=result/shots
         
@@ -120,21 +254,161 @@ class BVAlgorithm_qiskit(QuantumAlgorithm):
         return accuracy
 
 
+    '''
+    The noise model set on this algorithm, or else the one the simulator
+    carries itself (e.g. AerSimulator.from_backend). Passing noise_model=None
+    to run() would override the simulator's own model.
+    '''
+
+    def effective_noise_model(self) -> Any:
+        if self._noise_model is not None:
+            return self._noise_model
+        return getattr(self.simulator.options, 'noise_model', None)
+
+
+    '''
+    Transpile once and reuse the result across shot and noise sweeps.
+    Transpiling is kept even for AerSimulator: it cancels the H pairs on data
+    qubits whose bit of a is 0, which changes the accuracy under noise on h.
+    '''
+
+    def compile_circuit(self) -> _qiskit.QuantumCircuit:
+        if self._compiled_circuit is None:
+            self._compiled_circuit = _qiskit.transpile(self.circuit, self.simulator)
+        return self._compiled_circuit
+
+
+    '''
+    Read P(a) from the probabilities saved before measurement instead of counting samples.
+    Each shot is one noise trajectory and Aer averages the saved probabilities,
+    so only the noise is sampled, not the measurement outcome.
+    Measurement errors would act after the saved state, so noise models with
+    errors on measure use the counting path of compute_result.
+    '''
+
+    def compute_result_probability(self, shots) -> float:
+        if self._probability_circuit is None:
+            self._probability_circuit = self.compile_circuit().remove_final_measurements(inplace=False)
+            self._probability_circuit.save_probabilities_dict(self._data_q_idx, label='probabilities')
+        job = self.simulator.run(self._probability_circuit, shots=shots, noise_model=self.effective_noise_model())
+        probabilities = job.result().data(0)['probabilities']
+        # Outcomes are integer keys with data qubit 0 as least significant bit,
+        # which is a_to_string read MSB first
+        accuracy = probabilities.get(int(self._target_str, 2), 0)
+        outcome = max(probabilities, key=probabilities.get)
+        self.computed_a_value = int(format(outcome, '0{}b'.format(self.num_qubits - 1))[::-1], 2)
+        self.computed = True
+        return accuracy
+
+
+    '''
+    Exact accuracy under depolarizing noise p1 after every h/x gate and
+    p2 after every cz, computed from the gate counts instead of sampling.
+    Propagating the Pauli errors to the final measurement of the transpiled circuit:
+      - data qubits whose bit of a is 0 are idle, transpile cancels their H pair
+      - every other data qubit flips if its first or last H error has a Z (resp. X) part,
+        so both H errors together leave it correct with probability s=(1+(1-p1)^2)/2
+      - the target flips (X/Y part) after the initial X with probability p1/2,
+        a flipped target kicks a wrong phase onto every later CZ partner
+      - each CZ error flips its data qubit and the target through independent
+        halves of a uniformly random two qubit Pauli
+    The target flip is tracked as a two state Markov chain over the popcount(a) CZs.
+    '''
+
+    def compute_result_analytic(self, p1: float, p2: float) -> float:
+        num_cz = self._popcount
+        s = (1 + (1 - p1) ** 2) / 2
+        # Joint distribution of (data flip d, target flip t) for one CZ error
+        p_dt = {(0, 0): 1 - 3 * p2 / 4, (1, 0): p2 / 4, (0, 1): p2 / 4, (1, 1): p2 / 4}
+        # u = d xor (H error parity) must cancel the incoming target flip f
+        p_ut = {}
+        for t in (0, 1):
+            p_ut[(0, t)] = p_dt[(0, t)] * s + p_dt[(1, t)] * (1 - s)
+            p_ut[(1, t)] = p_dt[(1, t)] * s + p_dt[(0, t)] * (1 - s)
+        # transfer[f][f'] = P(data correct given target flip f, next target flip f')
+        transfer = np.array([[p_ut[(f, f ^ g)] for g in (0, 1)] for f in (0, 1)])
+        start = np.array([1 - p1 / 2, p1 / 2])
+        accuracy = start @ np.linalg.matrix_power(transfer, num_cz) @ np.ones(2)
+        # Every error flips with probability at most 1/2, so no outcome is more likely than a
+        self.computed_a_value = self._a
+        self.computed = True
+        return float(accuracy)
+
+
+    '''
+    Compute the accuracy for many (a,b) inputs at once.
+    All circuits share the same H/measure layers around their oracle, are
+    transpiled together and submitted to Aer in a single run, which executes them in parallel.
+    Each input uses the same estimator as compute_result.
+    '''
+
+    @classmethod
+    def batch_compute(cls, inputs: List, num_qubits: int, shots: int, noise_model: Any = None) -> np.ndarray:
+        alg = cls(num_qubits)
+        alg.set_noise_model(noise_model)
+        targets = []
+        for parameter in inputs:
+            alg.set_input(parameter)
+            targets.append(alg.a_to_string())
+        if noise_model is None:
+            return np.ones(len(inputs))
+        if isinstance(noise_model, _GateDepolarizingNoiseModel):
+            accuracies = np.empty(len(inputs))
+            for index, parameter in enumerate(inputs):
+                alg.set_input(parameter)
+                accuracies[index] = alg.compute_result_analytic(noise_model.p_single, noise_model.p_twoq)
+            return accuracies
+
+        prefix = _qiskit.QuantumCircuit(num_qubits, num_qubits - 1)
+        prefix.x(num_qubits - 1)
+        prefix.h(alg._data_q_idx)
+        suffix = _qiskit.QuantumCircuit(num_qubits, num_qubits - 1)
+        suffix.h(alg._data_q_idx)
+        suffix.measure(alg._data_q_idx, alg._data_q_idx)
+        circuits = [prefix.compose(cls._oracle(num_qubits, a, b)).compose(suffix) for a, b in inputs]
+        # Transpile all circuits in one call, as compute_result does for a single circuit
+        circuits = _qiskit.transpile(circuits, alg.simulator)
+        # Same estimator as compute_result: saved probabilities unless measure is noisy
+        use_probabilities = 'measure' not in noise_model.noise_instructions
+        if use_probabilities:
+            circuits = [circuit.remove_final_measurements(inplace=False) for circuit in circuits]
+            for circuit in circuits:
+                circuit.save_probabilities_dict(alg._data_q_idx, label='probabilities')
+
+        job = alg.simulator.run(circuits, shots=shots, noise_model=noise_model)
+        result = job.result()
+        accuracies = np.empty(len(inputs))
+        for index, target in enumerate(targets):
+            if use_probabilities:
+                accuracies[index] = result.data(index)['probabilities'].get(int(target, 2), 0)
+            else:
+                accuracies[index] = result.get_counts(index).get(target, 0) / shots
+        return accuracies
+
+
     def a_result(self) -> int:
         return self.computed_a_value
 
 
     def set_simulator(self,simulator):
-        self._simulator=simulator
+        self.simulator=simulator
+        self._compiled_circuit = None
+        self._probability_circuit = None
         
         
 '''
 The logic version of Berstain vazirani algorithm using [4,2,2] code
 '''
-def logicBValgorithm(QuantumAlgorithm):
+class logicBValgorithm(QuantumAlgorithm):
     def __init__(self, num_logic_qubits: int) -> None:
-        self.num_qubits = 4*num_logic_qubits
+        super().__init__(4*num_logic_qubits)
+        _lazy()
         self.num_logic_qubits = num_logic_qubits
+        self.circuit = _qiskit.QuantumCircuit(self.num_qubits, self.num_qubits - 1)
+        # Row i holds the four physical qubits of logical qubit i
+        self._phys = np.arange(4*num_logic_qubits, dtype=np.int32).reshape(num_logic_qubits, 4)
+        self._a = 0
+        self._b = 0
         
         
 
@@ -144,11 +418,47 @@ def logicBValgorithm(QuantumAlgorithm):
     
     #Implement the logial H gate    
     def logicH(self,index):
-        pass 
+        self.logicH_layer([index])
     
     #Implement the logial CNOT gate        
     def logicCNOT(self,control,target):
-        pass 
+        self.logicCNOT_batch([(control, target)])
+
+    #Apply the logical H on a whole layer of logical qubits in one compose
+    def logicH_layer(self,indices):
+        if len(indices) == 0:
+            return
+        qubits = self._phys[list(indices)].ravel().tolist()
+        self.circuit.compose(self._logicH_layer(self.num_qubits, tuple(qubits)), inplace=True)
+
+    #Apply a batch of logical CNOTs in one compose
+    def logicCNOT_batch(self,pairs):
+        if len(pairs) == 0:
+            return
+        controls = self._phys[[control for control, _ in pairs]].ravel().tolist()
+        targets = self._phys[[target for _, target in pairs]].ravel().tolist()
+        self.circuit.compose(self._logicCNOT_batch(self.num_qubits, tuple(controls), tuple(targets)), inplace=True)
+
+    '''
+    Layers are built once per set of physical qubits and reused.
+    H is applied transversally on each block, CNOT transversally between blocks.
+    '''
+
+    @classmethod
+    @functools.lru_cache(maxsize=128)
+    def _logicH_layer(cls, num_qubits: int, qubits: tuple) -> _qiskit.QuantumCircuit:
+        _lazy()
+        layer = _qiskit.QuantumCircuit(num_qubits)
+        layer.h(list(qubits))
+        return layer
+
+    @classmethod
+    @functools.lru_cache(maxsize=128)
+    def _logicCNOT_batch(cls, num_qubits: int, controls: tuple, targets: tuple) -> _qiskit.QuantumCircuit:
+        _lazy()
+        layer = _qiskit.QuantumCircuit(num_qubits)
+        layer.cx(list(controls), list(targets))
+        return layer
 
     #Implement the logial CZ gate  
     def logicCZ(self,control,target):
@@ -167,15 +477,16 @@ def logicBValgorithm(QuantumAlgorithm):
         pass
     
     def construct_circuit(self) -> None:
-        inputdim = self.num_qubits - 1
+        inputdim = self.num_logic_qubits - 1
         '''
         The first layer of Hadmard 
         '''
         self.logicX(inputdim)
-        self.logicH(list(range(0, self.num_qubits)))
+        self.logicH_layer(list(range(0, self.num_logic_qubits)))
         self.compile_func()
-        self.logicH(list(range(0, self.num_qubits)))
-        self.circuit.measure(list(range(0, self.num_qubits - 1)), list(range(0, self.num_qubits - 1)))
+        self.logicH_layer(list(range(0, self.num_logic_qubits)))
+        data_qubits = self._phys[:inputdim].ravel().tolist()
+        self.circuit.measure(data_qubits, data_qubits)
 
 
 
@@ -184,14 +495,17 @@ def logicBValgorithm(QuantumAlgorithm):
 
 
     def compile_func(self) -> None:
-        alist = convert_int_to_list(self.num_qubits - 1, self._a)
-        for i in range(0, self.num_qubits - 1):
-            if alist[i] == 1:
-                self.logicCNOT(i, self.num_qubits - 1)
-                #self.circuit.cx(i, self.num_qubits - 1)
+        last = self.num_logic_qubits - 1
+        # Only visit the set bits of a, most significant bit on logical qubit 0
+        pairs = []
+        t = self._a
+        while t:
+            pairs.append((last - 1 - ((t & -t).bit_length() - 1), last))
+            t &= t - 1
+        self.logicCNOT_batch(pairs)
         if self._b == 1:
             #self.circuit.x(self.num_qubits - 1)
-            self.logicX(self.num_qubits - 1)
+            self.logicX(last)
         return
 
     def set_input(self, parameter: List) -> None:
@@ -201,7 +515,7 @@ def logicBValgorithm(QuantumAlgorithm):
         self._b = parameter[1]
         if self._b != 0 and self._b != 1:
             raise ValueError("b has to be 0 or 1")
-        if not (0 <= self._a < (1 << (self.num_qubits - 1))):
+        if not (0 <= self._a < (1 << (self.num_logic_qubits - 1))):
             raise ValueError("a out of range")
 
 
@@ -209,6 +523,23 @@ def logicBValgorithm(QuantumAlgorithm):
         raise NotImplementedError("Subclasses must implement compute_result method.")    
 
 
+
+# Each a is an independent run, so sweeps are spread over worker processes.
+# Processes rather than threads since Aer runs its own native threads.
+# Workers are spawned, a fork after an Aer run inherits its threads and deadlocks.
+def _run_one(args):
+    a, b, num_qubits, shots, noise_model = args
+    alg = BVAlgorithm_qiskit(num_qubits)
+    alg.set_noise_model(noise_model)
+    alg.set_input([a, b])
+    alg.construct_circuit()
+    return alg.compute_result(shots)
+
+
+def sweep(a_list: List, b: int, num_qubits: int, shots: int, noise_model: Any = None, workers: int = None) -> List:
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return list(executor.map(_run_one, [(a, b, num_qubits, shots, noise_model) for a in a_list]))
+
         
 
 if "__main__" == __name__:
@@ -125,6 +125,21 @@ def construct_depolarizing_noise_model(p_single, p_twoq):
     return noise_model
 
 
+class GateDepolarizingNoiseModel(NoiseModel):
+    # Depolarizing noise on the h, x and cz gates of the BV circuit.
+    # The error rates are kept so BVAlgorithm_qiskit can compute the accuracy analytically.
+    def __init__(self, p_single, p_twoq):
+        super().__init__()
+        self.p_single = p_single
+        self.p_twoq = p_twoq
+        self.add_all_qubit_quantum_error(depolarizing_error(p_single, 1), ['h', 'x'])
+        self.add_all_qubit_quantum_error(depolarizing_error(p_twoq, 2), ['cz'])
+
+
+def construct_gate_depolarizing_noise_model(p_single, p_twoq):
+    return GateDepolarizingNoiseModel(p_single, p_twoq)
+
+
 def construct_thermal_noise_model(T1, T2):
     # Doc: https://qiskit.github.io/qiskit-aer/tutorials/3_building_noise_models.html
 
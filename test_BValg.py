@@ -0,0 +1,154 @@
+import random
+
+import numpy as np
+import pytest
+from qiskit_aer import AerSimulator
+from qiskit_aer.noise import NoiseModel, depolarizing_error
+
+import BValg
+from BValg import (BVAlgorithm_qiskit, logicBValgorithm, convert_int_to_list, convert_list_to_int,
+                   convert_ints_to_lists, convert_lists_to_ints, _run_one, sweep)
+from noise import construct_gate_depolarizing_noise_model
+
+
+def gate_qubits(circuit, name):
+    return sorted(tuple(circuit.find_bit(q).index for q in instruction.qubits)
+                  for instruction in circuit.data if instruction.operation.name == name)
+
+
+def brute_force_controls(num_inputs, a):
+    # Bit list of a, most significant bit first, as convert_int_to_list built it
+    bits = [(a >> (num_inputs - 1 - i)) & 1 for i in range(num_inputs)]
+    return [i for i in range(num_inputs) if bits[i] == 1]
+
+
+class TransversalXlogicBValgorithm(logicBValgorithm):
+    # logicX is still a stub, apply X on every physical qubit of the block
+    def logicX(self, index):
+        self.circuit.x(self._phys[index].tolist())
+
+
+def construct_h_cz_noise_model(p):
+    noise_model = NoiseModel()
+    noise_model.add_all_qubit_quantum_error(depolarizing_error(p, 1), ['h'])
+    noise_model.add_all_qubit_quantum_error(depolarizing_error(p, 2), ['cz'])
+    return noise_model
+
+
+def test_probability_path_matches_counts():
+    shots = 4000
+    noise_model = construct_h_cz_noise_model(0.05)
+    alg = BVAlgorithm_qiskit(6)
+    alg.set_noise_model(noise_model)
+    alg.set_input([0b10110, 0])
+    alg.construct_circuit()
+    accuracy = alg.compute_result_probability(shots)
+
+    result = alg.simulator.run(alg.compile_circuit(), shots=shots, noise_model=noise_model).result()
+    counted = result.get_counts().get(alg.a_to_string(), 0) / shots
+    assert 0.5 < accuracy < 1
+    assert abs(accuracy - counted) < 0.05
+
+
+def test_simulator_noise_model_is_used():
+    alg = BVAlgorithm_qiskit(6)
+    alg.set_simulator(AerSimulator(noise_model=construct_h_cz_noise_model(0.05)))
+    alg.set_input([0b10110, 0])
+    alg.construct_circuit()
+    accuracy = alg.compute_result(4000)
+    assert 0.5 < accuracy < 1
+    assert alg.a_result() == 0b10110
+
+
+def test_analytic_matches_simulation():
+    noise_model = construct_gate_depolarizing_noise_model(0.05, 0.1)
+    alg = BVAlgorithm_qiskit(6)
+    alg.set_noise_model(noise_model)
+    alg.set_input([0b10110, 1])
+    alg.construct_circuit()
+    simulated = alg.compute_result_probability(4000)
+    assert abs(alg.compute_result_analytic(0.05, 0.1) - simulated) < 0.03
+
+
+def test_batch_compute_matches_compute_result():
+    shots = 4000
+    noise_model = construct_h_cz_noise_model(0.05)
+    inputs = [(0b10110, 0), (0b00001, 1), (0b11111, 0)]
+    accuracies = BVAlgorithm_qiskit.batch_compute(inputs, 6, shots, noise_model)
+    for (a, b), accuracy in zip(inputs, accuracies):
+        alg = BVAlgorithm_qiskit(6)
+        alg.set_noise_model(noise_model)
+        alg.set_input([a, b])
+        alg.construct_circuit()
+        assert abs(alg.compute_result(shots) - accuracy) < 0.03
+
+
+def test_sweep_matches_serial_runs():
+    noise_model = construct_h_cz_noise_model(0.05)
+    a_list = [0b10110, 0b00001, 0b11111]
+    # The serial runs put Aer threads in this process first, as a notebook would
+    serial = [_run_one((a, 0, 6, 4000, noise_model)) for a in a_list]
+    parallel = sweep(a_list, 0, 6, 4000, noise_model, workers=2)
+    assert len(parallel) == len(serial)
+    for expected, accuracy in zip(serial, parallel):
+        assert abs(expected - accuracy) < 0.03
+
+
+def test_oracle_matches_brute_force():
+    num_qubits = 5
+    for a in range(1 << (num_qubits - 1)):
+        oracle = BVAlgorithm_qiskit._oracle(num_qubits, a, 0)
+        expected = [(i, num_qubits - 1) for i in brute_force_controls(num_qubits - 1, a)]
+        assert gate_qubits(oracle, 'cz') == expected
+
+
+def test_logic_compile_func_matches_brute_force():
+    num_logic_qubits = 4
+    last = num_logic_qubits - 1
+    for a in range(1 << last):
+        alg = logicBValgorithm(num_logic_qubits)
+        alg.set_input([a, 0])
+        alg.compile_func()
+        expected = sorted((4*i + k, 4*last + k) for i in brute_force_controls(last, a) for k in range(4))
+        assert gate_qubits(alg.circuit, 'cx') == expected
+
+
+def test_logic_circuit_measures_a():
+    num_logic_qubits = 3
+    last = num_logic_qubits - 1
+    for a in range(1 << last):
+        alg = TransversalXlogicBValgorithm(num_logic_qubits)
+        alg.set_input([a, 0])
+        alg.construct_circuit()
+        # Every physical qubit of logical data qubit i holds bit (last-1-i) of a
+        bits = [(a >> (last - 1 - i)) & 1 for i in range(last) for k in range(4)]
+        bits += [0] * (alg.num_qubits - 1 - len(bits))
+        expected = ''.join(str(bit) for bit in reversed(bits))
+        counts = AerSimulator().run(alg.circuit, shots=100).result().get_counts()
+        assert counts == {expected: 100}
+
+
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")
+@pytest.mark.parametrize("num_qubits", [1, 20, 63, 64, 70, 130])
+def test_scalar_conversion_round_trip(num_qubits):
+    # Below 64 bits convert_list_to_int folds in Python, from 64 bits on it uses packbits
+    rng = random.Random(num_qubits)
+    for value in [0, (1 << num_qubits) - 1] + [rng.getrandbits(num_qubits) for _ in range(20)]:
+        bitlist = convert_int_to_list(num_qubits, value)
+        assert bitlist == [(value >> (num_qubits - 1 - i)) & 1 for i in range(num_qubits)]
+        assert convert_list_to_int(num_qubits, bitlist) == value
+
+
+@pytest.mark.parametrize("use_numba", [False, True])
+@pytest.mark.parametrize("num_qubits", [1, 20, 64])
+def test_batch_conversion_round_trip(monkeypatch, use_numba, num_qubits):
+    if use_numba:
+        pytest.importorskip("numba")
+    else:
+        monkeypatch.setattr(BValg, "_numba_kernels", lambda: None)
+    rng = random.Random(num_qubits)
+    values = [0, (1 << num_qubits) - 1] + [rng.getrandbits(num_qubits) for _ in range(20)]
+    bits = convert_ints_to_lists(num_qubits, values)
+    expected = [[(value >> (num_qubits - 1 - i)) & 1 for i in range(num_qubits)] for value in values]
+    assert bits.tolist() == expected
+    assert convert_lists_to_ints(num_qubits, bits).tolist() == values